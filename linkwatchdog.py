@@ -0,0 +1,151 @@
+"""Link-loss watchdog.
+
+Receive threads call feed() for every valid packet on their channel. A
+watch thread polls every few milliseconds and, once the link has been
+silent on all channels for an action's timeout, fires that action. The
+actions escalate in timeout order; an action with repeatMs fires again at
+that interval for as long as the silence lasts, the others fire once. The
+first packet after any action fired calls onRearm and re-arms the chain.
+
+The watchdog only arms after the first packet so nothing fires while the
+drone is still connecting. For every action fired the delay between the
+deadline and the action completing is kept in latencies (milliseconds).
+"""
+import collections
+import ctypes
+import ctypes.util
+import threading
+import time
+import traceback
+
+CLOCK_MONOTONIC = 1             # Linux value
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _posixMonotonic():
+    """ clock_gettime(CLOCK_MONOTONIC) through ctypes, None if unavailable. """
+    for name in (ctypes.util.find_library('rt'), ctypes.util.find_library('c')):
+        if name is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(name, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+
+        def monotonic():
+            # called from several threads, so no shared timespec
+            ts = _timespec()
+            if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+                raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+            return ts.tv_sec + ts.tv_nsec * 1e-9
+        return monotonic
+    return None
+
+# wall clock steps (NTP on a board without RTC) must not trip the failsafe,
+# Python 2 has no time.monotonic so go to the C library for it
+_clock = getattr(time, 'monotonic', None) or _posixMonotonic() or time.time
+
+
+class LinkWatchdog:
+
+    POLL_INTERVAL           = 0.005          # sec
+    LATENCY_HISTORY         = 100
+
+    def __init__(self, channels, pollInterval=POLL_INTERVAL, onRearm=None):
+        self.pollInterval = pollInterval
+        self.onRearm = onRearm
+        self.lastRx = dict((channel, None) for channel in channels)
+        self.actions = []
+        self.silence = None
+        self.fired = 0
+        self.due = {}
+        self.latencies = collections.deque(maxlen=self.LATENCY_HISTORY)
+
+        self.stopEvent = threading.Event()
+        self.threadWatch = threading.Thread(
+            target=self._threadWatch,
+            args=(self.stopEvent, "task")
+        )
+        self.threadWatch.daemon = True
+
+    def start(self):
+        self.threadWatch.start()
+
+    def stop(self):
+        self.stopEvent.set()
+
+    def now(self):
+        """ Monotonic time in milliseconds. """
+        return _clock() * 1000.0
+
+    def addAction(self, timeoutMs, name, func, repeatMs=None):
+        """ Call func() once the link has been silent for timeoutMs.
+
+        With repeatMs the call is repeated at that interval until a packet
+        re-arms the chain.
+        """
+        actions = list(self.actions)
+        actions.append((timeoutMs, name, func, repeatMs))
+        actions.sort(key=lambda action: action[0])
+        self.actions = actions
+
+    def clearActions(self):
+        self.actions = []
+
+    def feed(self, channel):
+        """ Note a valid packet on channel. Called from the RX threads. """
+        self.lastRx[channel] = self.now()
+
+    def age(self, channel=None):
+        """ Milliseconds since the last packet on channel (or any), None if never. """
+        last = self._lastRx(channel)
+        if last is None:
+            return None
+        return self.now() - last
+
+    def _lastRx(self, channel=None):
+        if channel is not None:
+            return self.lastRx[channel]
+        times = [t for t in self.lastRx.values() if t is not None]
+        return max(times) if times else None
+
+    def _check(self):
+        last = self._lastRx()
+        if last is None:
+            return
+
+        # a packet since the previous check re-arms the whole chain
+        if last != self.silence:
+            if self.fired > 0 and self.onRearm is not None:
+                self.onRearm()
+            self.silence = last
+            self.fired = 0
+            self.due = {}
+
+        for i, (timeoutMs, name, func, repeatMs) in enumerate(self.actions):
+            dueMs = self.due.get(i, timeoutMs)
+            if dueMs is None:
+                continue
+            deadline = last + dueMs
+            if self.now() < deadline:
+                continue
+
+            self.due[i] = None if repeatMs is None else dueMs + repeatMs
+            self.fired = self.fired + 1
+            print('link lost for {0:d} ms, failsafe: {1}'.format(int(dueMs), name))
+            try:
+                func()
+            except Exception:
+                traceback.print_exc()
+            self.latencies.append((name, self.now() - deadline))
+
+###############################################################################
+# Watch Thread
+###############################################################################
+    def _threadWatch(self, stop_event, arg):
+        while not stop_event.wait(self.pollInterval):
+            self._check()
@@ -0,0 +1,211 @@
+"""Segmented H264 recording with a keyframe index.
+
+The recorder writes the Annex-B stream received from the drone into a
+series of segment files (video_0000.h264, video_0001.h264, ...) and keeps
+a sidecar index (video.idx) with one fixed size record per keyframe:
+
+    header : magic 'TIDX', version            (8 bytes)
+    record : timestamp us, offset, segment, flags (24 bytes, little endian)
+
+Timestamps are Tello.getTimestamp() values (microseconds since the epoch),
+the same clock used for telemetry, so video and flight data line up.
+Each chunk is scanned for start codes, so a datagram may carry any mix of
+NAL units. A keyframe is an SPS group (SPS, PPS, ...) followed by an IDR
+slice. Everything from the first SPS on is written; once a segment is full
+the next SPS group is held back until its next slice shows whether it is a
+keyframe, so every segment after the first starts on one and can be decoded
+on its own.
+"""
+import mmap
+import os
+import struct
+
+
+class VideoRecorder:
+
+    INDEX_MAGIC             = b'TIDX'
+    INDEX_VERSION           = 1
+    INDEX_HEADER            = struct.Struct('<4sI')
+    INDEX_RECORD            = struct.Struct('<qQII')
+    INDEX_NAME              = 'video.idx'
+    SEGMENT_NAME            = 'video_{0:04d}.h264'
+    SEGMENT_SIZE            = 64 * 1024 * 1024
+
+# NAL unit types
+    NAL_SLICE               = 1
+    NAL_IDR                 = 5
+    NAL_SPS                 = 7
+
+# Index record flags
+    FLAG_IDR                = 0x01
+
+    def __init__(self, path, segmentSize=SEGMENT_SIZE):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self.segmentSize = segmentSize
+        self.segment = -1
+        self.offset = 0
+        self.fileVideo = None
+        self.pending = None
+        self.awaitingIdr = False
+        self.keyTs = 0
+        self.keyOffset = 0
+        self.keySegment = 0
+        self.fileIndex = open(os.path.join(path, self.INDEX_NAME), 'wb')
+        self.fileIndex.write(
+            self.INDEX_HEADER.pack(self.INDEX_MAGIC, self.INDEX_VERSION)
+        )
+        self.fileIndex.flush()
+
+    def write(self, buf, timestamp):
+        """ Append one chunk of Annex-B data received at timestamp (us). """
+        starts = self._scanNals(buf)
+        if not starts or starts[0][0] > 0:
+            # head of the chunk continues the previous NAL unit
+            self._writeNal(buf[:starts[0][0] if starts else len(buf)], None, timestamp)
+        for i, (start, nalType) in enumerate(starts):
+            end = starts[i + 1][0] if i + 1 < len(starts) else len(buf)
+            self._writeNal(buf[start:end], nalType, timestamp)
+
+    def close(self):
+        self._writePending()
+        if self.fileVideo is not None:
+            self.fileVideo.close()
+            self.fileVideo = None
+        self.fileIndex.close()
+
+    def _scanNals(self, buf):
+        """ Return [(position, nalType)] of every start code in buf. """
+        starts = []
+        pos = buf.find(b'\x00\x00\x01')
+        while pos >= 0 and pos + 3 < len(buf):
+            start = pos - 1 if pos > 0 and buf[pos - 1:pos] == b'\x00' else pos
+            starts.append((start, ord(buf[pos + 3:pos + 4]) & 0x1f))
+            pos = buf.find(b'\x00\x00\x01', pos + 3)
+        return starts
+
+    def _writeNal(self, buf, nalType, timestamp):
+        if nalType == self.NAL_SPS:
+            self._writePending()
+            if self.fileVideo is None:
+                self._openSegment()
+            self.keyTs = timestamp
+            self.awaitingIdr = True
+            if self.offset >= self.segmentSize:
+                # may start the next segment, decided by the next slice
+                self.pending = [buf]
+                return
+            self.keyOffset = self.offset
+            self.keySegment = self.segment
+
+        elif self.awaitingIdr and nalType in (self.NAL_SLICE, self.NAL_IDR):
+            self.awaitingIdr = False
+            if nalType == self.NAL_IDR:
+                if self.pending is not None:
+                    self._openSegment()
+                    self.keyOffset = self.offset
+                    self.keySegment = self.segment
+                self.fileIndex.write(
+                    self.INDEX_RECORD.pack(
+                        self.keyTs, self.keyOffset, self.keySegment, self.FLAG_IDR
+                    )
+                )
+                self.fileIndex.flush()
+            self._writePending()
+
+        if self.pending is not None:
+            # PPS, SEI or continuation still belong to the held back group
+            self.pending.append(buf)
+            return
+        self._writeData(buf)
+
+    def _writePending(self):
+        """ Write a held back SPS group to the current segment. """
+        if self.pending is not None:
+            for buf in self.pending:
+                self._writeData(buf)
+            self.pending = None
+
+    def _writeData(self, buf):
+        if self.fileVideo is None:
+            # nothing decodable before the first SPS
+            return
+        self.fileVideo.write(buf)
+        self.offset = self.offset + len(buf)
+
+    def _openSegment(self):
+        if self.fileVideo is not None:
+            self.fileVideo.close()
+        self.segment = self.segment + 1
+        self.offset = 0
+        self.fileVideo = open(
+            os.path.join(self.path, self.SEGMENT_NAME.format(self.segment)),
+            'wb'
+        )
+
+
+class VideoIndex:
+    """ Read side of a recording: memory-mapped keyframe index. """
+
+    def __init__(self, path):
+        self.path = path
+        self.fileIndex = open(os.path.join(path, VideoRecorder.INDEX_NAME), 'rb')
+        self.map = mmap.mmap(self.fileIndex.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = VideoRecorder.INDEX_HEADER.unpack_from(self.map, 0)
+        if magic != VideoRecorder.INDEX_MAGIC:
+            raise ValueError('not a video index: {0}'.format(path))
+        if version != VideoRecorder.INDEX_VERSION:
+            raise ValueError('unsupported index version {0:d}'.format(version))
+
+        # ignore a partially written trailing record
+        size = len(self.map) - VideoRecorder.INDEX_HEADER.size
+        self.count = size // VideoRecorder.INDEX_RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.map.close()
+        self.fileIndex.close()
+
+    def entry(self, i):
+        """ Return (timestamp, segment, offset) of keyframe i. """
+        ts, offset, segment, flags = VideoRecorder.INDEX_RECORD.unpack_from(
+            self.map,
+            VideoRecorder.INDEX_HEADER.size + i * VideoRecorder.INDEX_RECORD.size
+        )
+        return ts, segment, offset
+
+    def find(self, timestamp):
+        """ Index of the last keyframe at or before timestamp (0 if none). """
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.entry(mid)[0] <= timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return max(lo - 1, 0)
+
+    def read(self, timestamp, chunkSize=65536):
+        """ Yield stream data starting from the keyframe nearest timestamp. """
+        if self.count == 0:
+            return
+
+        ts, segment, offset = self.entry(self.find(timestamp))
+        while True:
+            name = os.path.join(self.path, VideoRecorder.SEGMENT_NAME.format(segment))
+            if not os.path.exists(name):
+                break
+            with open(name, 'rb') as f:
+                f.seek(offset)
+                while True:
+                    buf = f.read(chunkSize)
+                    if not buf:
+                        break
+                    yield buf
+            segment = segment + 1
+            offset = 0
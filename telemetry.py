@@ -0,0 +1,226 @@
+"""Telemetry time-series store.
+
+Each series is a set of float columns plus an int64 timestamp column kept
+in a fixed capacity ring buffer. Every sample is written twice, at slot i
+and i + capacity, so any window of up to capacity samples is a contiguous
+slice and queries return NumPy views without copying or locking. The
+oldest slot is the one the writer reuses next, so a full ring exposes
+capacity - 1 samples.
+
+Long sessions are covered by downsampled levels: level k holds the mean of
+every FACTOR samples of level k - 1. A series can optionally live in a
+memory-mapped file per level so the history survives the process; the
+partially built buckets are kept in a small .acc file next to them.
+
+Timestamps are Tello.getTimestamp() values, the same clock as the video
+index written by recorder.VideoRecorder.
+"""
+import os
+import numpy as np
+
+
+class RingSeries:
+
+    HEADER_MAGIC            = 0x4d4c5454     # 'TTLM'
+    HEADER_SIZE             = 4              # magic, capacity, fields, count
+
+    def __init__(self, fields, capacity, path=None):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self.path = path
+        size = self.HEADER_SIZE + 2 * capacity * (1 + len(self.fields))
+
+        if path is None:
+            self.buf = np.zeros(size, dtype=np.int64)
+        elif os.path.exists(path):
+            self.buf = np.memmap(path, dtype=np.int64, mode='r+', shape=(size,))
+            if (
+                self.buf[0] != self.HEADER_MAGIC or
+                self.buf[1] != capacity or
+                self.buf[2] != len(self.fields)
+            ):
+                raise ValueError('telemetry file layout mismatch: {0}'.format(path))
+        else:
+            self.buf = np.memmap(path, dtype=np.int64, mode='w+', shape=(size,))
+
+        self.header = self.buf[:self.HEADER_SIZE]
+        self.header[0] = self.HEADER_MAGIC
+        self.header[1] = capacity
+        self.header[2] = len(self.fields)
+        self.count = int(self.header[3])
+
+        start = self.HEADER_SIZE
+        self.ts = self.buf[start:start + 2 * capacity]
+        start = start + 2 * capacity
+        self.values = self.buf[start:].view(np.float64).reshape(
+            len(self.fields), 2 * capacity
+        )
+
+    def __len__(self):
+        return min(self.count, self.capacity - 1)
+
+    def append(self, timestamp, values):
+        """ Store one sample, O(1). Only one writer thread is supported. """
+        i = self.count % self.capacity
+        j = i + self.capacity
+        self.ts[i] = timestamp
+        self.ts[j] = timestamp
+        self.values[:, i] = values
+        self.values[:, j] = values
+
+        # publish the sample last so readers never see a half written slot
+        self.count = self.count + 1
+        self.header[3] = self.count
+
+    def oldest(self):
+        """ Timestamp of the oldest sample still held, None if empty. """
+        count = self.count
+        if count == 0:
+            return None
+        return int(self.ts[max(count + 1 - self.capacity, 0) % self.capacity])
+
+    def query(self, t0=None, t1=None):
+        """ Samples with t0 <= timestamp <= t1 as a dict of NumPy views.
+
+        The views alias the ring; copy them if they must outlive another
+        capacity worth of appends.
+        """
+        count = self.count
+        lo = max(count + 1 - self.capacity, 0)
+        start = lo % self.capacity
+        ts = self.ts[start:start + count - lo]
+
+        a = lo if t0 is None else lo + int(np.searchsorted(ts, t0, 'left'))
+        b = count if t1 is None else lo + int(np.searchsorted(ts, t1, 'right'))
+
+        # drop samples the writer lapped while we were searching
+        a = max(a, self.count + 1 - self.capacity)
+        b = max(a, b)
+
+        start = a % self.capacity
+        end = start + b - a
+        result = {'ts': self.ts[start:end]}
+        for k, name in enumerate(self.fields):
+            result[name] = self.values[k, start:end]
+        return result
+
+    def flush(self):
+        if self.path is not None:
+            self.buf.flush()
+
+
+class TelemetrySeries:
+    """ Ring series with multi-resolution downsampled levels. """
+
+    CAPACITY                = 16384
+    LEVELS                  = 3
+    FACTOR                  = 10
+
+    ACC_MAGIC               = 0x43434154     # 'TACC'
+    ACC_HEADER_SIZE         = 4              # magic, levels, factor, fields
+
+    def __init__(self, fields, capacity=CAPACITY, levels=LEVELS, factor=FACTOR, path=None):
+        self.fields = tuple(fields)
+        self.factor = factor
+        self.levels = []
+        for k in range(levels):
+            name = None if path is None else '{0}.{1:d}'.format(path, k)
+            self.levels.append(RingSeries(self.fields, capacity, name))
+
+        # bucket being built for each coarser level: count, start, sums
+        # row k - 1 feeds level k
+        rows = levels - 1
+        size = self.ACC_HEADER_SIZE + rows * (2 + len(self.fields))
+        if path is None:
+            self.accBuf = np.zeros(size, dtype=np.int64)
+        else:
+            name = path + '.acc'
+            if os.path.exists(name):
+                self.accBuf = np.memmap(name, dtype=np.int64, mode='r+', shape=(size,))
+                if (
+                    self.accBuf[0] != self.ACC_MAGIC or
+                    self.accBuf[1] != levels or
+                    self.accBuf[2] != factor or
+                    self.accBuf[3] != len(self.fields)
+                ):
+                    raise ValueError('telemetry file layout mismatch: {0}'.format(name))
+            else:
+                self.accBuf = np.memmap(name, dtype=np.int64, mode='w+', shape=(size,))
+        self.accBuf[0] = self.ACC_MAGIC
+        self.accBuf[1] = levels
+        self.accBuf[2] = factor
+        self.accBuf[3] = len(self.fields)
+
+        acc = self.accBuf[self.ACC_HEADER_SIZE:].reshape(rows, 2 + len(self.fields))
+        self.accCount = acc[:, 0]
+        self.accStart = acc[:, 1]
+        self.accSum = acc[:, 2:].view(np.float64)
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    def append(self, timestamp, values):
+        """ Store one sample and feed the downsampled levels, amortised O(1). """
+        self.levels[0].append(timestamp, values)
+
+        for k in range(1, len(self.levels)):
+            row = k - 1
+            if self.accCount[row] == 0:
+                self.accStart[row] = timestamp
+            self.accSum[row] += values
+            self.accCount[row] += 1
+            if self.accCount[row] < self.factor:
+                break
+
+            timestamp = self.accStart[row]
+            values = self.accSum[row] / self.factor
+            self.levels[k].append(timestamp, values)
+            self.accSum[row] = 0.0
+            self.accCount[row] = 0
+
+    def levelFor(self, t0):
+        """ Finest level that still holds samples back to t0. """
+        for k, level in enumerate(self.levels):
+            oldest = level.oldest()
+            if oldest is not None and oldest <= t0:
+                return k
+        return len(self.levels) - 1
+
+    def query(self, t0=None, t1=None, level=0):
+        return self.levels[level].query(t0, t1)
+
+    def flush(self):
+        for level in self.levels:
+            level.flush()
+        if isinstance(self.accBuf, np.memmap):
+            self.accBuf.flush()
+
+
+class TelemetryStore:
+    """ The series recorded from the Tello command channel. """
+
+    STATUS_FIELDS = (
+        'height', 'northSpeed', 'eastSpeed', 'groundSpeed', 'flyTime',
+        'battery', 'batteryLeft', 'flyTimeLeft'
+    )
+    WIFI_FIELDS = ('strength', 'disturb')
+    ALT_LIMIT_FIELDS = ('height',)
+
+    def __init__(self, path=None, capacity=TelemetrySeries.CAPACITY,
+                 levels=TelemetrySeries.LEVELS, factor=TelemetrySeries.FACTOR):
+        if path is not None and not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+
+        self.status = self._series('status', self.STATUS_FIELDS, capacity, levels, factor)
+        self.wifi = self._series('wifi', self.WIFI_FIELDS, capacity, levels, factor)
+        self.altLimit = self._series('altlimit', self.ALT_LIMIT_FIELDS, capacity, levels, factor)
+
+    def flush(self):
+        self.status.flush()
+        self.wifi.flush()
+        self.altLimit.flush()
+
+    def _series(self, name, fields, capacity, levels, factor):
+        path = None if self.path is None else os.path.join(self.path, name)
+        return TelemetrySeries(fields, capacity, levels, factor, path)
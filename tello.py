@@ -17,12 +17,14 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """
 import socket
+import struct
 import threading
 import time
 import traceback
 import datetime
 from timertask import TimerTask
 from bytebuffer import ByteBuffer
+from linkwatchdog import LinkWatchdog
 
 class Tello:
 
@@ -140,8 +142,35 @@ class Tello:
 
     NEW_ALT_LIMIT = 30
 
-    def __init__(self, tello_ip='192.168.10.1', portCmd=8889):
+# Failsafe escalation, ms since the last packet on any channel
+    FAILSAFE_HOVER_MS                   = 500
+    FAILSAFE_LAND_MS                    = 1500
+    FAILSAFE_RECONNECT_MS               = 3000
+    FAILSAFE_LAND_REPEAT_MS             = 500
+    FAILSAFE_RECONNECT_REPEAT_MS        = 1000
+
+# Stick centre
+    STICK_MID                           = 1024
+
+    def __init__(self, tello_ip='192.168.10.1', portCmd=8889, recorder=None, telemetry=None, failsafe=True,
+                 video_ip='192.168.10.2', portVideo=TELLO_PORT_VIDEO):
         self.pill2kill = threading.Event()
+        self.recorder = recorder
+        self.telemetry = telemetry
+        self.addrVideo = (video_ip, portVideo)
+        self.videoHeader = None
+        self.failsafeActive = False
+        self.watchdog = LinkWatchdog(('cmd', 'video'), onRearm=self._failsafeClear)
+        if failsafe:
+            self.watchdog.addAction(self.FAILSAFE_HOVER_MS, 'hover', self._failsafeHover)
+            self.watchdog.addAction(
+                self.FAILSAFE_LAND_MS, 'land', self.land,
+                self.FAILSAFE_LAND_REPEAT_MS
+            )
+            self.watchdog.addAction(
+                self.FAILSAFE_RECONNECT_MS, 'reconnect', self._failsafeReconnect,
+                self.FAILSAFE_RECONNECT_REPEAT_MS
+            )
         self.task20ms = TimerTask(0.02, self._timerTask, "World")
 
         self.sockCmd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -163,21 +192,26 @@ class Tello:
         self.stickData = 0
         self.rcCtr = 0
         self._sendCmd(0x00, self.TELLO_CMD_CONN, None)
+        self.watchdog.start()
 
     def __del__(self):
         self.stop()
 
     def stop(self):
+        self.watchdog.stop()
         self.task20ms.stop()
         self.pill2kill.set()
         self.sockCmd.close()
 
+    def getTimestamp(self):
+        """ Session clock in microseconds, shared by video and telemetry. """
+        return int(time.time() * 1000000)
+
     def setStickData(self, fast, roll, pitch, thr, yaw):
-        self.stickData = (fast << 44) \
-            | (yaw << 33) \
-            | (thr << 22) \
-            | (pitch << 11) \
-            | (roll)
+        # the failsafe holds the sticks centred until the link is back
+        if self.failsafeActive:
+            return
+        self.stickData = self._packStickData(fast, roll, pitch, thr, yaw)
 
     def takeOff(self):
         self._sendCmd(0x68, self.TELLO_CMD_TAKEOFF, None)
@@ -243,6 +277,28 @@ class Tello:
             )
         )
 
+    def _packStickData(self, fast, roll, pitch, thr, yaw):
+        return (fast << 44) \
+            | (yaw << 33) \
+            | (thr << 22) \
+            | (pitch << 11) \
+            | (roll)
+
+    def _failsafeHover(self):
+        """ Latch centred sticks so the drone holds position. """
+        self.failsafeActive = True
+        mid = self.STICK_MID
+        self.stickData = self._packStickData(0, mid, mid, mid, mid)
+
+    def _failsafeClear(self):
+        """ Link is back, hand the sticks to the caller again. """
+        if self.failsafeActive:
+            print('link restored, failsafe released')
+        self.failsafeActive = False
+
+    def _failsafeReconnect(self):
+        self._sendCmd(0x00, self.TELLO_CMD_CONN, None)
+
 ###############################################################################
 # utility functions
 ###############################################################################
@@ -300,18 +356,26 @@ class Tello:
         return bb
 
     def _parsePacket(self, buf):
+        """ Return (cmdID, isValid), isValid is False on a framing or CRC error. """
         dataSize = 0
         cmdID = 0
+        isValid = False
 
         if len(buf) >= 11:
             bb = ByteBuffer.wrap(buf)
             mark = bb.get_ULInt8()
             if mark == 0xCC:
                 size = bb.get_ULInt16() >> 3
+                if size < 11 or size > len(buf):
+                    print('wrong packet size={0:d}, length={1:d}'.format(size, len(buf)))
+                    return cmdID, isValid
+
+                isValid = True
                 crc8 = bb.get_ULInt8()
                 calcCRC8 = self._calcCRC8(buf, 3)
                 if crc8 != calcCRC8:
-                    print('wrong CRC8 {0:02x / 1:02x}'.format(crc8, calcCRC8))
+                    print('wrong CRC8 {0:02x} / {1:02x}'.format(crc8, calcCRC8))
+                    isValid = False
 
                 pacType = bb.get_ULInt8()
                 cmdID = bb.get_ULInt16()
@@ -325,24 +389,59 @@ class Tello:
                 crc16 = bb.get_ULInt16()
                 calcCRC16 = self._calcCRC16(buf, size - 2)
                 if crc16 != calcCRC16:
-                    print('wrong CRC8 {0:04x / 1:04x}'.format(crc16, calcCRC16))
+                    print('wrong CRC16 {0:04x} / {1:04x}'.format(crc16, calcCRC16))
+                    isValid = False
                 # print 'pt:{0:02x}, cmd:{1:4d}={2:04x}, seq:{3:04x}, data_sz:{4:d} - '.format(pacType, cmdID, cmdID, seqID, dataSize)
             else:
                 if mark == 0x63:
                     ack = ByteBuffer.allocate(11)
                     ack.put_bytes('conn_ack:'.encode())
-                    ack.put_ULInt16(self.TELLO_PORT_VIDEO)
+                    ack.put_ULInt16(self.addrVideo[1])
                     ack.flip()
                     if ack.get_array() == buf:
                         cmdID = self.TELLO_CMD_CONN_ACK
+                        isValid = True
                     else:
                         print('wrong video port !!')
                 else:
                     print('wrong mark !! {0:02x}'.format(mark))
         elif buf is not None:
-            print 'wrong packet length={0:d}, 1st byte={1:02x}'.format(len(buf), buf[0])
+            print('wrong packet length={0:d}, 1st byte={1:02x}'.format(len(buf), buf[0]))
+
+        return cmdID, isValid
+
+    def _isVideoPacket(self, buf, size):
+        """ Check a video datagram before it counts as a sign of life.
+
+        The 2 byte header is frame number and fragment index (bit 7 marks
+        the last fragment). A datagram starting a NAL unit needs a proper
+        start code and NAL header, a continuation must carry the next
+        fragment of the last good datagram or the first of the next frame.
+        """
+        if size <= 6:
+            return False
+
+        frame = buf[0]
+        fragment = buf[1] & 0x7f
+        if buf[2] == 0x00 and buf[3] == 0x00:
+            isValid = (
+                buf[4] == 0x00 and
+                buf[5] == 0x01 and
+                (buf[6] & 0x80) == 0 and
+                1 <= (buf[6] & 0x1f) <= 23
+            )
+        elif self.videoHeader is not None:
+            lastFrame, lastFragment = self.videoHeader
+            isValid = (
+                (frame == lastFrame and fragment == lastFragment + 1) or
+                (frame == (lastFrame + 1) & 0xff and fragment == 0)
+            )
+        else:
+            isValid = False
 
-        return cmdID
+        if isValid:
+            self.videoHeader = (frame, fragment)
+        return isValid
 
     def _sendCmd(self, pacType, cmdID, data):
         bb = None
@@ -355,7 +454,7 @@ class Tello:
             out = ByteBuffer.allocate(11)
             out.clear()
             out.put_bytes('conn_req:'.encode())
-            out.put_ULInt16(self.TELLO_PORT_VIDEO)
+            out.put_ULInt16(self.addrVideo[1])
             self.seqID = self.seqID + 1
         elif cmdID == self.TELLO_CMD_STICK:
             now = datetime.datetime.now()
@@ -418,18 +517,21 @@ class Tello:
         while not stop_event.is_set():
             try:
                 size, addr = self.sockCmd.recvfrom_into(data)
-            except socket.timeout, e:
-                time.sleep(.5)
+            except socket.timeout as e:
+                # recvfrom already waited, don't go deaf on top of it
                 continue
-            except socket.error, e:
-                print e
+            except socket.error as e:
+                print(e)
                 continue
             else:
-                cmdID = self._parsePacket(data[:size])
+                timestamp = self.getTimestamp()
+                cmdID, isValid = self._parsePacket(data[:size])
                 payload = ByteBuffer.wrap(data[9:size-1])
+                if isValid:
+                    self.watchdog.feed('cmd')
 
                 if cmdID == self.TELLO_CMD_CONN_ACK:
-                    print 'connection successful !'
+                    print('connection successful !')
                     # self._printArray(data[:size])
 
                 elif cmdID == self.TELLO_CMD_DATE_TIME:
@@ -447,22 +549,35 @@ class Tello:
                         self._sendCmd(0x48, self.TELLO_CMD_SET_EV, bytearray([0x00]))
                     statusCtr = statusCtr + 1
 
+                    if self.telemetry is not None and size >= 9 + 17 + 2:
+                        # height, speeds N/E/ground, fly time, flags, battery %, battery left, fly time left
+                        self.telemetry.status.append(
+                            timestamp,
+                            struct.unpack_from('<hhhhhxxBHH', data, 9)
+                        )
+
+                elif cmdID == self.TELLO_CMD_WIFI_SIGNAL:
+                    if self.telemetry is not None and size >= 9 + 2 + 2:
+                        self.telemetry.wifi.append(timestamp, (data[9], data[10]))
+
                 elif cmdID == self.TELLO_CMD_VERSION_STRING:
                     if size >= 42:
-                        print 'Version:' + data[10:30].decode()
+                        print('Version:' + data[10:30].decode())
 
                 elif cmdID == self.TELLO_CMD_SMART_VIDEO_START:
                     if payload.get_remaining() > 0:
-                        print 'smart video start'
+                        print('smart video start')
 
                 elif cmdID == self.TELLO_CMD_ALT_LIMIT:
                     if payload.get_remaining() > 0:
                         payload.get_ULInt8()                    # 0x00
                         height = payload.get_ULInt16()
-                        print 'alt limit : {0:2d} meter'.format(height)
+                        print('alt limit : {0:2d} meter'.format(height))
+                        if self.telemetry is not None:
+                            self.telemetry.altLimit.append(timestamp, (height,))
 
                         if height != self.NEW_ALT_LIMIT:
-                            print 'set new alt limit : {0:2d} meter'.format(self.NEW_ALT_LIMIT)
+                            print('set new alt limit : {0:2d} meter'.format(self.NEW_ALT_LIMIT))
                             self._sendCmd(0x68, self.TELLO_CMD_SET_ALT_LIMIT, bytearray([self.NEW_ALT_LIMIT & 0xff, (self.NEW_ALT_LIMIT >> 8) & 0xff]));
 
                 elif cmdID == self.TELLO_CMD_SMART_VIDEO_STATUS:
@@ -471,12 +586,14 @@ class Tello:
                         dummy = resp & 0x07
                         start = (resp >> 3) & 0x03
                         mode = (resp >> 5) & 0x07
-                        print 'smart video status - mode:{0:d}, start:{1:d}'.format(mode, start)
+                        print('smart video status - mode:{0:d}, start:{1:d}'.format(mode, start))
                         self._sendCmd(0x50, self.TELLO_CMD_SMART_VIDEO_STATUS, bytearray([0x00]))
                 # else:
                     # for i in data:
                     #    print hex(ord(i)),
                     # print ''
+        if self.telemetry is not None:
+            self.telemetry.flush()
         # print '_threadCmdRX terminated !!!'
 
 
@@ -487,13 +604,15 @@ class Tello:
         # print '_threadVideoRX started !!!'
 
         sockVideo = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        addrVideo = ('192.168.10.2', self.TELLO_PORT_VIDEO)
+        addrVideo = self.addrVideo
         sockVideo.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sockVideo.settimeout(.5)
         sockVideo.bind(addrVideo)
 
         data = bytearray(4096)
-        fileVideo = open('video.h264', 'wb')
+        fileVideo = None
+        if self.recorder is None:
+            fileVideo = open('video.h264', 'wb')
         isSPSRcvd = False
 
         # FFMPeg h264 stream pipe instead of writing to file
@@ -503,13 +622,15 @@ class Tello:
         while not stop_event.is_set():
             try:
                 size, addr = sockVideo.recvfrom_into(data)
-            except socket.timeout, e:
-                time.sleep(.5)
+            except socket.timeout as e:
                 continue
-            except socket.error, e:
-                print e
+            except socket.error as e:
+                print(e)
                 break
             else:
+                timestamp = self.getTimestamp()
+                if self._isVideoPacket(data, size):
+                    self.watchdog.feed('video')
                 if (
                     size > 6 and
                     data[2] == 0x00 and
@@ -523,13 +644,19 @@ class Tello:
                         isSPSRcvd = True
 
                 # drop 2 bytes
-                if isSPSRcvd:
+                if self.recorder is not None:
+                    # recorder finds the SPS and IDR units itself
+                    self.recorder.write(data[2:size], timestamp)
+                elif isSPSRcvd:
                     # if p is not None:
                     #     p.stdin.write(data[2:size])
                     fileVideo.write(data[2:size])
 
         sockVideo.close()
-        fileVideo.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        else:
+            fileVideo.close()
         # if p is not None:
         #     p.kill()
         # print '_threadVideoRX terminated !!!'
@@ -0,0 +1,149 @@
+"""Link-loss failsafe against a local stand-in drone that goes silent.
+
+Run with: python -m unittest test_linkwatchdog
+"""
+import socket
+import struct
+import threading
+import time
+import unittest
+
+from linkwatchdog import LinkWatchdog, _posixMonotonic
+
+# detection-to-action latency bound, poll interval plus scheduling slack
+LATENCY_BOUND_MS = 50
+
+
+def freePort():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class StandInDrone:
+    """ Answers conn_req and sends a packet every 20 ms while talking. """
+
+    def __init__(self, makePacket):
+        self.makePacket = makePacket
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(.02)
+        self.addr = self.sock.getsockname()
+        self.peer = None
+        self.cmdIDs = []
+        self.talking = threading.Event()
+        self.stopEvent = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        self.thread.join()
+        self.sock.close()
+
+    def _run(self):
+        data = bytearray(1024)
+        while not self.stopEvent.is_set():
+            try:
+                size, peer = self.sock.recvfrom_into(data)
+            except socket.timeout:
+                pass
+            else:
+                self.peer = peer
+                if data[:9] == bytearray(b'conn_req:'):
+                    if self.talking.is_set():
+                        self.sock.sendto(b'conn_ack:' + bytes(data[9:11]), peer)
+                elif size >= 11 and data[0] == 0xCC:
+                    self.cmdIDs.append(struct.unpack_from('<H', data, 5)[0])
+
+            if self.talking.is_set() and self.peer is not None:
+                packet = self.makePacket()
+                if packet is not None:
+                    self.sock.sendto(packet, self.peer)
+
+
+class LinkWatchdogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rearmed = []
+        self.watchdog = LinkWatchdog(('cmd',), onRearm=lambda: self.rearmed.append(True))
+        self.watchdog.addAction(100, 'land', lambda: None, 50)
+        self.watchdog.addAction(50, 'hover', lambda: None)
+        self.watchdog.addAction(200, 'reconnect', lambda: None)
+
+        self.drone = StandInDrone(lambda: b'status')
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.settimeout(.02)
+        self.stopEvent = threading.Event()
+        self.thread = threading.Thread(target=self._threadRX)
+        self.thread.daemon = True
+
+    def tearDown(self):
+        self.watchdog.stop()
+        self.stopEvent.set()
+        self.thread.join()
+        self.drone.stop()
+        self.sock.close()
+
+    def _threadRX(self):
+        data = bytearray(64)
+        while not self.stopEvent.is_set():
+            try:
+                self.sock.recvfrom_into(data)
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            self.watchdog.feed('cmd')
+
+    def names(self):
+        return [name for name, latency in self.watchdog.latencies]
+
+    def testEscalationLatency(self):
+        self.watchdog.start()
+        self.thread.start()
+        time.sleep(.1)
+        self.assertEqual(self.names(), [])      # not armed before any packet
+
+        self.drone.talking.set()
+        self.sock.sendto(b'hello', self.drone.addr)
+        time.sleep(.2)
+        self.assertEqual(self.names(), [])
+
+        self.drone.talking.clear()
+        time.sleep(.28)
+        names = self.names()
+        self.assertEqual(names[0], 'hover')
+        self.assertEqual(names[1], 'land')
+        self.assertIn('reconnect', names)
+        self.assertGreaterEqual(names.count('land'), 3)
+        for name, latency in self.watchdog.latencies:
+            self.assertLess(latency, LATENCY_BOUND_MS, name)
+
+        self.drone.talking.set()
+        time.sleep(.05)
+        self.assertEqual(self.rearmed, [True])
+        fired = len(self.watchdog.latencies)
+        time.sleep(.03)
+        self.assertEqual(len(self.watchdog.latencies), fired)
+
+
+class ClockTest(unittest.TestCase):
+
+    def testPosixMonotonic(self):
+        # the Python 2 clock source, checked against time.monotonic here
+        monotonic = _posixMonotonic()
+        if monotonic is None or not hasattr(time, 'monotonic'):
+            self.skipTest('needs clock_gettime and time.monotonic')
+        a = monotonic()
+        b = time.monotonic()
+        c = monotonic()
+        self.assertLessEqual(a, c)
+        self.assertLess(abs(b - a), .01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""Segmented recorder and keyframe index on a synthetic NAL stream.
+
+Run with: python -m unittest test_recorder
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from recorder import VideoIndex, VideoRecorder
+
+
+def nal(nalType, payload=b'xxxx', longStart=True):
+    start = b'\x00\x00\x00\x01' if longStart else b'\x00\x00\x01'
+    return start + bytes(bytearray([0x60 | nalType])) + payload
+
+SPS = nal(7)
+PPS = nal(8)
+IDR = nal(5)
+SLICE = nal(1)
+
+
+class VideoRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def record(self, chunks, segmentSize=VideoRecorder.SEGMENT_SIZE):
+        recorder = VideoRecorder(self.path, segmentSize)
+        for ts, chunk in enumerate(chunks):
+            recorder.write(chunk, ts * 1000)
+        recorder.close()
+        return VideoIndex(self.path)
+
+    def segment(self, n):
+        name = os.path.join(self.path, VideoRecorder.SEGMENT_NAME.format(n))
+        with open(name, 'rb') as f:
+            return f.read()
+
+    def entries(self, index):
+        return [index.entry(i) for i in range(len(index))]
+
+    def testSpsFollowedByIdrIsIndexed(self):
+        index = self.record([SPS, PPS, IDR, SLICE])
+        self.assertEqual(self.entries(index), [(0, 0, 0)])
+        self.assertEqual(self.segment(0), SPS + PPS + IDR + SLICE)
+        index.close()
+
+    def testSpsWithoutIdrIsWrittenButNotIndexed(self):
+        chunks = [SPS, PPS, IDR, SLICE, SPS, PPS, SLICE, SPS, PPS, IDR]
+        index = self.record(chunks)
+        self.assertEqual(self.entries(index), [(0, 0, 0), (7000, 0, 7 * len(SPS))])
+        self.assertEqual(self.segment(0), b''.join(chunks))
+        index.close()
+
+    def testDataBeforeFirstSpsIsSkipped(self):
+        index = self.record([SLICE, b'tail', SPS, PPS, IDR])
+        self.assertEqual(self.entries(index), [(2000, 0, 0)])
+        self.assertEqual(self.segment(0), SPS + PPS + IDR)
+        index.close()
+
+    def testMultiNalPackets(self):
+        chunks = [
+            SLICE + SPS + nal(8, longStart=False) + IDR,
+            b'continuation',
+            SLICE,
+            nal(6) + SPS + PPS,
+            IDR + SLICE,
+        ]
+        index = self.record(chunks)
+        # the leading slice comes before any SPS and is skipped
+        offset = len(SPS + nal(8, longStart=False) + IDR + b'continuation' + SLICE + nal(6))
+        self.assertEqual(self.entries(index), [(0, 0, 0), (3000, 0, offset)])
+        self.assertEqual(self.segment(0), b''.join(chunks)[len(SLICE):])
+        index.close()
+
+    def testRolloverOnlyAtKeyframes(self):
+        group = SPS + PPS + IDR
+        chunks = [group, SLICE, SLICE, SPS + PPS + SLICE, group, SLICE]
+        index = self.record(chunks, segmentSize=len(group) + 1)
+        self.assertEqual(self.entries(index), [(0, 0, 0), (4000, 1, 0)])
+        self.assertEqual(self.segment(0), b''.join(chunks[:4]))
+        self.assertEqual(self.segment(1), group + SLICE)
+        index.close()
+
+    def testFindAndRead(self):
+        group = SPS + PPS + IDR
+        chunks = [group, SLICE, group, SLICE, group, SLICE]
+        index = self.record(chunks, segmentSize=1)
+        self.assertEqual([e[1] for e in self.entries(index)], [0, 1, 2])
+
+        self.assertEqual(index.find(-1), 0)
+        self.assertEqual(index.find(0), 0)
+        self.assertEqual(index.find(1500), 0)
+        self.assertEqual(index.find(2000), 1)
+        self.assertEqual(index.find(3999), 1)
+        self.assertEqual(index.find(10 ** 9), 2)
+
+        self.assertEqual(b''.join(index.read(3000)), b''.join(chunks[2:]))
+        self.assertEqual(b''.join(index.read(0, chunkSize=3)), b''.join(chunks))
+        index.close()
+
+    def testTrailingPartialRecordIgnored(self):
+        self.record([SPS, PPS, IDR, SPS, PPS, IDR]).close()
+        with open(os.path.join(self.path, VideoRecorder.INDEX_NAME), 'ab') as f:
+            f.write(b'\x01' * (VideoRecorder.INDEX_RECORD.size - 1))
+        index = VideoIndex(self.path)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.find(10 ** 9), 1)
+        index.close()
+
+    def testBadMagic(self):
+        with open(os.path.join(self.path, VideoRecorder.INDEX_NAME), 'wb') as f:
+            f.write(b'NOPE' + b'\x00' * 28)
+        self.assertRaises(ValueError, VideoIndex, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
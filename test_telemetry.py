@@ -0,0 +1,138 @@
+"""Telemetry ring, downsampling and persistence.
+
+Run with: python -m unittest test_telemetry
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+    from telemetry import RingSeries, TelemetrySeries, TelemetryStore
+except ImportError:
+    # telemetry is optional and needs numpy
+    np = None
+
+
+@unittest.skipIf(np is None, 'telemetry needs numpy')
+class RingSeriesTest(unittest.TestCase):
+
+    def testEmpty(self):
+        ring = RingSeries(('v',), 4)
+        self.assertEqual(len(ring), 0)
+        self.assertIsNone(ring.oldest())
+        self.assertEqual(len(ring.query()['ts']), 0)
+
+    def testWrapAround(self):
+        ring = RingSeries(('v', 'w'), 4)
+        for i in range(1, 11):
+            ring.append(i, (i, -i))
+
+        # the slot the writer reuses next is not readable
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.oldest(), 8)
+        q = ring.query()
+        self.assertEqual(list(q['ts']), [8, 9, 10])
+        self.assertEqual(list(q['v']), [8.0, 9.0, 10.0])
+        self.assertEqual(list(q['w']), [-8.0, -9.0, -10.0])
+        self.assertEqual(list(ring.query(ring.oldest())['ts']), [8, 9, 10])
+
+    def testRangeQueryIsView(self):
+        ring = RingSeries(('v',), 8)
+        for i in range(13):
+            ring.append(i * 10, (i,))
+        q = ring.query(75, 110)
+        self.assertEqual(list(q['ts']), [80, 90, 100, 110])
+        self.assertIsNotNone(q['v'].base)
+        self.assertEqual(len(ring.query(200, 300)['ts']), 0)
+        self.assertEqual(len(ring.query(0, 10)['ts']), 0)
+
+
+@unittest.skipIf(np is None, 'telemetry needs numpy')
+class TelemetrySeriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def fill(self, series, first, last):
+        for i in range(first, last):
+            series.append(i * 10, (i,))
+
+    def testLevelMeansAndTimestamps(self):
+        series = TelemetrySeries(('v',), capacity=16, levels=3, factor=2)
+        self.fill(series, 0, 9)
+        q1 = series.query(level=1)
+        self.assertEqual(list(q1['ts']), [0, 20, 40, 60])
+        self.assertEqual(list(q1['v']), [0.5, 2.5, 4.5, 6.5])
+        q2 = series.query(level=2)
+        self.assertEqual(list(q2['ts']), [0, 40])
+        self.assertEqual(list(q2['v']), [1.5, 5.5])
+
+    def testLevelFor(self):
+        series = TelemetrySeries(('v',), capacity=4, levels=3, factor=2)
+        self.fill(series, 0, 16)
+        # level 0 holds 130..150, level 1 100..140, level 2 40..120
+        self.assertEqual(series.levelFor(140), 0)
+        self.assertEqual(series.levelFor(120), 1)
+        self.assertEqual(series.levelFor(50), 2)
+        self.assertEqual(series.levelFor(0), 2)
+        # the chosen level's query really reaches back to t0
+        for t0 in (140, 120, 50):
+            level = series.levelFor(t0)
+            self.assertLessEqual(series.query(level=level)['ts'][0], t0)
+
+    def testReopenContinuesBuckets(self):
+        path = os.path.join(self.path, 's')
+        series = TelemetrySeries(('v',), capacity=16, levels=3, factor=2, path=path)
+        self.fill(series, 0, 5)
+        series.flush()
+        del series
+
+        series = TelemetrySeries(('v',), capacity=16, levels=3, factor=2, path=path)
+        self.fill(series, 5, 9)
+
+        unbroken = TelemetrySeries(('v',), capacity=16, levels=3, factor=2)
+        self.fill(unbroken, 0, 9)
+        for level in range(3):
+            for key in ('ts', 'v'):
+                self.assertEqual(list(series.query(level=level)[key]),
+                                 list(unbroken.query(level=level)[key]))
+
+    def testReopenLayoutMismatch(self):
+        path = os.path.join(self.path, 's')
+        TelemetrySeries(('v',), capacity=16, levels=3, factor=2, path=path).flush()
+        # the level files match these, only the .acc header catches them
+        for levels, factor in ((2, 2), (3, 4)):
+            self.assertRaises(ValueError, TelemetrySeries, ('v',), 16, levels, factor, path)
+        self.assertRaises(ValueError, TelemetrySeries, ('v', 'w'), 16, 3, 2, path)
+        self.assertRaises(ValueError, TelemetrySeries, ('v',), 8, 3, 2, path)
+
+
+@unittest.skipIf(np is None, 'telemetry needs numpy')
+class TelemetryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def testPersistedStore(self):
+        store = TelemetryStore(self.path, capacity=8, levels=2, factor=2)
+        store.wifi.append(100, (90, 3))
+        store.altLimit.append(100, (30,))
+        store.flush()
+        del store
+
+        store = TelemetryStore(self.path, capacity=8, levels=2, factor=2)
+        self.assertEqual(list(store.wifi.query()['strength']), [90.0])
+        self.assertEqual(list(store.altLimit.query()['height']), [30.0])
+        self.assertEqual(len(store.status), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,282 @@
+"""Tello packet checks and failsafe wiring against a local stand-in drone.
+
+timertask and bytebuffer come from pytello; when they are not on the path
+minimal stand-ins are installed so the session logic can still be tested.
+
+Run with: python -m unittest test_tello
+"""
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+
+from recorder import VideoRecorder
+from test_linkwatchdog import LATENCY_BOUND_MS, StandInDrone, freePort
+
+
+class _TimerTask:
+
+    def __init__(self, interval, func, arg):
+        self.stopEvent = threading.Event()
+
+        def run():
+            while not self.stopEvent.wait(interval):
+                func(arg)
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+
+
+class _ByteBuffer:
+
+    def __init__(self, buf):
+        self.buf = bytearray(buf)
+        self.position = 0
+        self.limit = len(self.buf)
+
+    @classmethod
+    def allocate(cls, size):
+        return cls(bytearray(size))
+
+    @classmethod
+    def wrap(cls, buf):
+        return cls(buf)
+
+    def clear(self):
+        self.position = 0
+        self.limit = len(self.buf)
+
+    def flip(self):
+        self.limit = self.position
+        self.position = 0
+
+    def get_array(self):
+        return self.buf
+
+    def get_remaining(self):
+        return self.limit - self.position
+
+    def set_position(self, position):
+        self.position = position
+
+    def put(self, data, offset=0, length=None):
+        if length is None:
+            length = len(data) - offset
+        self.put_bytes(data[offset:offset + length])
+
+    def put_bytes(self, data):
+        self.buf[self.position:self.position + len(data)] = data
+        self.position = self.position + len(data)
+
+    def _put(self, fmt, value):
+        struct.pack_into(fmt, self.buf, self.position, value)
+        self.position = self.position + struct.calcsize(fmt)
+
+    def _get(self, fmt):
+        value = struct.unpack_from(fmt, self.buf, self.position)[0]
+        self.position = self.position + struct.calcsize(fmt)
+        return value
+
+    def put_ULInt8(self, value):
+        self._put('<B', value)
+
+    def put_ULInt16(self, value):
+        self._put('<H', value)
+
+    def put_ULInt64(self, value):
+        self._put('<Q', value)
+
+    def get_ULInt8(self):
+        return self._get('<B')
+
+    def get_ULInt16(self):
+        return self._get('<H')
+
+
+for _name, _attr, _stub in (
+    ('timertask', 'TimerTask', _TimerTask),
+    ('bytebuffer', 'ByteBuffer', _ByteBuffer),
+):
+    try:
+        __import__(_name)
+    except ImportError:
+        _module = types.ModuleType(_name)
+        setattr(_module, _attr, _stub)
+        sys.modules[_name] = _module
+
+import tello
+
+
+class TelloTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tello = None
+        self.drone = StandInDrone(self.makePacket)
+        self.drone.talking.set()
+        # a recorder keeps the session from writing video.h264 into cwd
+        self.path = tempfile.mkdtemp()
+        self.tello = tello.Tello(
+            tello_ip=self.drone.addr[0], portCmd=self.drone.addr[1],
+            recorder=VideoRecorder(self.path),
+            video_ip='127.0.0.1', portVideo=freePort()
+        )
+
+    def tearDown(self):
+        self.tello.stop()
+        self.drone.stop()
+        self.tello.threadVideoRX.join()
+        shutil.rmtree(self.path)
+
+    def makePacket(self):
+        if self.tello is None:
+            return None
+        return self.statusPacket()
+
+    def statusPacket(self):
+        pkt = self.tello._buildPacket(0x50, tello.Tello.TELLO_CMD_STATUS, 0, bytearray(24))
+        return bytes(pkt.get_array())
+
+    def waitFor(self, condition, timeout=2):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(.01)
+        return condition()
+
+
+class PacketTest(TelloTestCase):
+
+    def testParsePacket(self):
+        pkt = bytearray(self.statusPacket())
+        self.assertEqual(self.tello._parsePacket(pkt), (tello.Tello.TELLO_CMD_STATUS, True))
+
+        bad = bytearray(pkt)
+        bad[15] ^= 0x01
+        self.assertEqual(self.tello._parsePacket(bad), (tello.Tello.TELLO_CMD_STATUS, False))
+
+        bad = bytearray(pkt)
+        bad[3] ^= 0x01
+        self.assertFalse(self.tello._parsePacket(bad)[1])
+
+        self.assertEqual(self.tello._parsePacket(pkt[:20]), (0, False))
+
+        ack = bytearray(b'conn_ack:' + struct.pack('<H', self.tello.addrVideo[1]))
+        self.assertEqual(self.tello._parsePacket(ack), (tello.Tello.TELLO_CMD_CONN_ACK, True))
+        ack = bytearray(b'conn_ack:' + struct.pack('<H', self.tello.addrVideo[1] ^ 1))
+        self.assertEqual(self.tello._parsePacket(ack), (0, False))
+
+    def testIsVideoPacket(self):
+        check = self.tello._isVideoPacket
+
+        def pkt(frame, fragment, payload):
+            buf = bytearray([frame, fragment]) + bytearray(payload)
+            return buf, len(buf)
+
+        self.assertFalse(check(*pkt(0, 0, b'\x01\x02\x03')))
+        self.assertFalse(check(*pkt(0, 1, b'junk junk')))            # nothing to continue
+        self.assertFalse(check(*pkt(0, 0, b'\x00\x00\x00\x02\x67')))  # bad start code
+        self.assertFalse(check(*pkt(0, 0, b'\x00\x00\x00\x01\xe7')))  # forbidden bit
+        self.assertFalse(check(*pkt(0, 0, b'\x00\x00\x00\x01\x60')))  # NAL type 0
+
+        self.assertTrue(check(*pkt(7, 0, b'\x00\x00\x00\x01\x67abc')))
+        self.assertTrue(check(*pkt(7, 1, b'continued')))
+        self.assertTrue(check(*pkt(7, 0x82, b'continued')))          # last fragment
+        self.assertFalse(check(*pkt(7, 5, b'continued')))            # skipped fragment
+        self.assertFalse(check(*pkt(9, 0, b'continued')))            # skipped frame
+        self.assertTrue(check(*pkt(8, 0, b'continued')))
+
+        self.tello.videoHeader = (255, 4)
+        self.assertTrue(check(*pkt(0, 0, b'wraps around')))
+
+
+class FeedTest(TelloTestCase):
+
+    def setUp(self):
+        self.corrupt = True
+        TelloTestCase.setUp(self)
+
+    def makePacket(self):
+        if self.tello is None:
+            return None
+        pkt = bytearray(self.statusPacket())
+        if self.corrupt:
+            pkt[-1] ^= 0xff
+        return bytes(pkt)
+
+    def testCorruptCommandPacketsDoNotFeed(self):
+        # conn_ack is the only good packet, then only bad CRCs arrive
+        self.assertTrue(self.waitFor(lambda: self.tello.watchdog.age('cmd') is not None))
+        time.sleep(.1)
+        self.assertGreater(self.tello.watchdog.age('cmd'), 80)
+
+        self.corrupt = False
+        self.assertTrue(self.waitFor(lambda: self.tello.watchdog.age('cmd') < 50))
+
+    def testJunkVideoDoesNotFeed(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for i in range(20):
+                sock.sendto(b'\xaa\x55 junk on the video port', self.tello.addrVideo)
+                time.sleep(.005)
+            time.sleep(.05)
+            self.assertIsNone(self.tello.watchdog.age('video'))
+
+            sock.sendto(b'\x00\x00\x00\x00\x00\x01\x67sps', self.tello.addrVideo)
+            self.assertTrue(self.waitFor(lambda: self.tello.watchdog.age('video') is not None))
+        finally:
+            sock.close()
+
+
+class FailsafeTest(TelloTestCase):
+
+    def testHoverLatch(self):
+        self.tello.setStickData(0, 1684, 364, 1684, 364)
+        moving = self.tello.stickData
+
+        self.tello._failsafeHover()
+        neutral = self.tello.stickData
+        mid = tello.Tello.STICK_MID
+        self.assertEqual(neutral, self.tello._packStickData(0, mid, mid, mid, mid))
+        self.tello.setStickData(0, 1684, 364, 1684, 364)
+        self.assertEqual(self.tello.stickData, neutral)
+
+        self.tello._failsafeClear()
+        self.tello.setStickData(0, 1684, 364, 1684, 364)
+        self.assertEqual(self.tello.stickData, moving)
+
+    def testSilentDroneLands(self):
+        self.assertTrue(self.waitFor(lambda: self.tello.watchdog.age() is not None))
+
+        self.drone.talking.clear()
+        time.sleep((tello.Tello.FAILSAFE_RECONNECT_MS + 200) / 1000.0)
+
+        names = [name for name, latency in self.tello.watchdog.latencies]
+        self.assertEqual(names[:2], ['hover', 'land'])
+        self.assertIn('reconnect', names)
+        self.assertGreater(names.count('land'), 1)
+        for name, latency in self.tello.watchdog.latencies:
+            self.assertLess(latency, LATENCY_BOUND_MS, name)
+        self.assertGreater(self.drone.cmdIDs.count(tello.Tello.TELLO_CMD_LANDING), 1)
+
+        # hover is latched against the controller loop
+        self.assertTrue(self.tello.failsafeActive)
+        held = self.tello.stickData
+        self.tello.setStickData(0, 1684, 1684, 1684, 1684)
+        self.assertEqual(self.tello.stickData, held)
+
+        self.drone.talking.set()
+        self.assertTrue(self.waitFor(lambda: not self.tello.failsafeActive))
+        landed = len(self.tello.watchdog.latencies)
+        time.sleep(.6)
+        self.assertEqual(len(self.tello.watchdog.latencies), landed)
+
+
+if __name__ == '__main__':
+    unittest.main()